@@ -1,9 +1,10 @@
 """
 Main Gradio Application - Chat-Driven SQL Database Interface
 """
+import asyncio
 import gradio as gr
-from db_utils import init_database, list_tables, get_table_schema, run_sql
-from llm_utils import prompt_text_to_sql, prompt_explain_results
+from db_utils import init_database, list_tables, get_table_schema, stream_sql, enforce_select_limit, MAX_STREAM_ROWS, DEFAULT_SELECT_LIMIT
+from llm_utils import prompt_text_to_sql, prompt_explain_results, strip_code_fence
 from ingest_utils import csv_to_sql, create_table_from_text, insert_rows_from_text
 import os
 
@@ -14,75 +15,96 @@ init_database()
 # TAB 1: Upload CSV
 # =============================================================================
 
-def upload_csv_handler(file, table_name):
+async def upload_csv_handler(file, table_name):
     """Handle CSV file upload"""
     if file is None:
         return "Please upload a CSV file"
     if not table_name:
         return "Please provide a table name"
-    
-    result = csv_to_sql(file.name, table_name)
+
+    # CSV parsing + bulk load is blocking, so keep it off the event loop
+    result = await asyncio.to_thread(csv_to_sql, file.name, table_name)
     return result
 
 # =============================================================================
 # TAB 2: Create Table from Chat
 # =============================================================================
 
-def create_table_handler(description):
+async def create_table_handler(description):
     """Create table from natural language"""
     if not description:
         return "Please provide a table description"
-    
-    result = create_table_from_text(description)
+
+    result = await create_table_from_text(description)
     return result
 
 # =============================================================================
 # TAB 3: Insert Rows from Chat
 # =============================================================================
 
-def insert_rows_handler(table_name, rows_description):
+async def insert_rows_handler(table_name, rows_description):
     """Insert rows from natural language"""
     if not table_name or not rows_description:
         return "Please provide both table name and row description"
-    
-    result = insert_rows_from_text(table_name, rows_description)
+
+    result = await insert_rows_from_text(table_name, rows_description)
     return result
 
 # =============================================================================
 # TAB 4: Query with Natural Language
 # =============================================================================
 
-def query_handler(question, table_name):
-    """Handle natural language question"""
+async def query_handler(question, table_name, max_rows=DEFAULT_SELECT_LIMIT):
+    """Handle natural language question, streaming results as they arrive"""
     if not question or not table_name:
-        return "Please provide both a question and select a table", "", ""
-    
+        yield "Please provide both a question and select a table", "", ""
+        return
+
     # Get table schema
-    schema = get_table_schema(table_name)
-    
+    schema = await asyncio.to_thread(get_table_schema, table_name)
+
     # Generate SQL
-    sql = prompt_text_to_sql(question, schema)
-    
+    sql = await prompt_text_to_sql(question, schema)
+
     # Clean SQL
-    sql = sql.strip()
-    if sql.startswith("```sql"):
-        sql = sql.replace("```sql", "").replace("```", "").strip()
-    
-    # Execute query
-    results = run_sql(sql, fetch=True)
-    
-    if isinstance(results, str) and "Error" in results:
-        return results, sql, ""
-    
-    # Format results
-    result_text = f"Columns: {', '.join(results['columns'])}\n\n"
-    for row in results['rows']:
-        result_text += str(row) + "\n"
-    
-    # Get explanation
-    explanation = prompt_explain_results(question, sql, results['rows'])
-    
-    return result_text, sql, explanation
+    sql = strip_code_fence(sql)
+
+    yield "Running query...", sql, ""
+
+    # Cap how many rows the generated SELECT can pull back
+    exec_sql = enforce_select_limit(sql, int(max_rows))
+
+    # Execute query, streaming chunks to the UI as they arrive; each
+    # blocking fetch runs in a worker thread so other requests proceed
+    result_text = ""
+    rows = []
+    stream = stream_sql(exec_sql)
+    while True:
+        chunk = await asyncio.to_thread(next, stream, None)
+        if chunk is None:
+            break
+        if isinstance(chunk, str):
+            yield chunk, sql, ""
+            return
+
+        columns, chunk_rows = chunk
+        if not result_text:
+            result_text = f"Columns: {', '.join(columns)}\n\n"
+        for row in chunk_rows:
+            result_text += str(row) + "\n"
+        rows.extend(chunk_rows)
+        yield result_text, sql, ""
+
+    if len(rows) >= MAX_STREAM_ROWS:
+        result_text += f"\n(Results truncated at {MAX_STREAM_ROWS} rows)\n"
+
+    # Kick off the explanation and show the final results while it runs
+    explain_task = asyncio.create_task(prompt_explain_results(question, sql, rows))
+    yield result_text, sql, ""
+
+    explanation = await explain_task
+
+    yield result_text, sql, explanation
 
 # =============================================================================
 # GRADIO INTERFACE
@@ -170,7 +192,14 @@ with gr.Blocks(title="Chat-Driven SQL Database", theme=gr.themes.Soft()) as demo
             
             refresh_btn = gr.Button("🔄 Refresh Tables", size="sm")
             refresh_btn.click(fn=refresh_tables, outputs=query_table)
-            
+
+            query_limit = gr.Slider(
+                label="Max Rows",
+                minimum=10,
+                maximum=MAX_STREAM_ROWS,
+                value=DEFAULT_SELECT_LIMIT,
+                step=10
+            )
             query_button = gr.Button("Get Answer", variant="primary")
             
             with gr.Row():
@@ -182,7 +211,7 @@ with gr.Blocks(title="Chat-Driven SQL Database", theme=gr.themes.Soft()) as demo
             
             query_button.click(
                 fn=query_handler,
-                inputs=[query_question, query_table],
+                inputs=[query_question, query_table, query_limit],
                 outputs=[query_results, query_sql, query_explanation]
             )
     
@@ -194,4 +223,5 @@ if __name__ == "__main__":
     print("🚀 Starting Chat-Driven SQL Database...")
     print("📊 Initializing database...")
     print("🌐 Launching Gradio interface...")
+    demo.queue(default_concurrency_limit=8, max_size=64)
     demo.launch(share=False, server_name="127.0.0.1", server_port=7860)
\ No newline at end of file
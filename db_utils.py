@@ -1,41 +1,48 @@
 """
 Database utilities: MySQL connection, query execution, schema retrieval
 """
-import mysql.connector
-from mysql.connector import Error
+import MySQLdb
+import MySQLdb.cursors
+from MySQLdb import Error
 from sqlalchemy import create_engine, text
+import sqlparse
 import os
+import re
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Connection settings, read once at import instead of per call
+MYSQL_HOST = os.getenv('MYSQL_HOST', 'localhost')
+MYSQL_PORT = int(os.getenv('MYSQL_PORT', 3306))
+MYSQL_USER = os.getenv('MYSQL_USER', 'root')
+MYSQL_PASSWORD = os.getenv('MYSQL_PASSWORD')
+MYSQL_DATABASE = os.getenv('MYSQL_DATABASE', 'chatdb')
+
+# Shared SQLAlchemy engine (mysqlclient C driver), created on first use so
+# startup works even if the database isn't reachable yet
+_engine = None
+
+def get_sqlalchemy_engine():
+    """Return the shared SQLAlchemy engine, creating it on first use"""
+    global _engine
+    if _engine is None:
+        connection_string = (
+            f"mysql+mysqldb://{MYSQL_USER}:{MYSQL_PASSWORD}"
+            f"@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
+        )
+        _engine = create_engine(connection_string, pool_size=8, pool_pre_ping=True)
+    return _engine
+
 def get_mysql_connection():
-    """Create and return MySQL connection"""
+    """Borrow a DB-API connection from the engine pool (close() returns it)"""
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv('MYSQL_HOST', 'localhost'),
-            port=int(os.getenv('MYSQL_PORT', 3306)),
-            user=os.getenv('MYSQL_USER', 'root'),
-            password=os.getenv('MYSQL_PASSWORD'),
-            database=os.getenv('MYSQL_DATABASE', 'chatdb')
-        )
-        if connection.is_connected():
-            return connection
-    except Error as e:
+        return get_sqlalchemy_engine().raw_connection()
+    except Exception as e:
         print(f"Error connecting to MySQL: {e}")
         return None
 
-def get_sqlalchemy_engine():
-    """Create SQLAlchemy engine for complex operations"""
-    user = os.getenv('MYSQL_USER', 'root')
-    password = os.getenv('MYSQL_PASSWORD')
-    host = os.getenv('MYSQL_HOST', 'localhost')
-    port = os.getenv('MYSQL_PORT', 3306)
-    database = os.getenv('MYSQL_DATABASE', 'chatdb')
-    
-    connection_string = f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}"
-    return create_engine(connection_string)
-
 def run_sql(query, fetch=True):
     """
     Execute SQL query and return results
@@ -53,49 +60,171 @@ def run_sql(query, fetch=True):
     try:
         cursor = connection.cursor()
         cursor.execute(query)
-        
+
         if fetch:
             results = cursor.fetchall()
             columns = [desc[0] for desc in cursor.description] if cursor.description else []
-            connection.close()
             return {"columns": columns, "rows": results}
         else:
             connection.commit()
-            connection.close()
             return f"Success: Query executed. Rows affected: {cursor.rowcount}"
-    
+
     except Error as e:
-        connection.close()
         return f"Error executing query: {e}"
+    finally:
+        connection.close()
+
+STREAM_CHUNK_SIZE = 500
+MAX_STREAM_ROWS = 50000
+DEFAULT_SELECT_LIMIT = 1000
+
+def enforce_select_limit(query, limit=DEFAULT_SELECT_LIMIT):
+    """
+    Cap how many rows a SELECT can return
+    Wraps the query in a LIMIT subselect if it is a single SELECT with no
+    top-level LIMIT of its own; anything else is returned unchanged.
+    """
+    parsed = sqlparse.parse(query)
+    if len(parsed) != 1:
+        return query
+
+    statement = parsed[0]
+    if statement.get_type() != 'SELECT':
+        return query
+
+    for token in statement.tokens:
+        if token.ttype is sqlparse.tokens.Keyword and token.normalized == 'LIMIT':
+            return query
+
+    inner = query.rstrip().rstrip(';')
+    return f"SELECT * FROM ({inner}) AS limited LIMIT {int(limit)}"
+
+def stream_sql(query, chunk_size=STREAM_CHUNK_SIZE, max_rows=MAX_STREAM_ROWS):
+    """
+    Execute a SELECT query and stream results in chunks instead of
+    buffering the whole resultset in memory
+    Args:
+        query: SQL query string
+        chunk_size: Rows fetched per chunk
+        max_rows: Hard cap on rows streamed (caller should show a
+                  truncation marker when this many rows come back)
+    Yields:
+        (columns, rows_chunk) tuples, or an error string on failure
+    """
+    connection = get_mysql_connection()
+    if not connection:
+        yield "Error: Could not connect to database"
+        return
+
+    cursor = None
+    try:
+        # MySQLdb's default cursor buffers the whole resultset client-side
+        # on execute; SSCursor fetches from the server as rows are read
+        cursor = connection.cursor(MySQLdb.cursors.SSCursor)
+        cursor.execute(query)
+        columns = [desc[0] for desc in cursor.description] if cursor.description else []
+
+        fetched = 0
+        yielded = False
+        while fetched < max_rows:
+            rows = cursor.fetchmany(min(chunk_size, max_rows - fetched))
+            if not rows:
+                break
+            fetched += len(rows)
+            yielded = True
+            yield (columns, rows)
+
+        if not yielded:
+            yield (columns, [])
+
+    except Error as e:
+        yield f"Error executing query: {e}"
+    finally:
+        # Close the cursor first: it drains any unread rows, so the
+        # connection goes back to the pool without a pending resultset
+        if cursor is not None:
+            cursor.close()
+        connection.close()
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]{0,63}")
+
+def is_valid_identifier(name):
+    """Check that a table/column name is a plain MySQL identifier"""
+    return bool(_IDENTIFIER_RE.fullmatch(name))
+
+# Short-lived cache for table list and schemas, so each click doesn't pay
+# fresh SHOW TABLES / DESCRIBE round trips; invalidated on DDL
+METADATA_CACHE_TTL = 30
+_metadata_cache = {}
+
+def _metadata_cache_get(key):
+    """Return a cached value if present and not expired, else None"""
+    entry = _metadata_cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+def _metadata_cache_set(key, value):
+    _metadata_cache[key] = (time.monotonic() + METADATA_CACHE_TTL, value)
+
+def invalidate_metadata_cache(table_name=None):
+    """Drop cached table list/schema entries after a CREATE or DROP"""
+    if table_name is None:
+        _metadata_cache.clear()
+    else:
+        _metadata_cache.pop(('schema', table_name), None)
+        _metadata_cache.pop(('tables',), None)
 
 def get_table_schema(table_name):
     """
     Get schema information for a table
-    Returns: String describing table structure
+    Returns: Compact one-line DDL-style description, e.g.
+             "students(id int, name varchar(100), gpa float)"
     """
+    if not is_valid_identifier(table_name):
+        return f"Error: Invalid table name: {table_name}"
+
+    cached = _metadata_cache_get(('schema', table_name))
+    if cached is not None:
+        return cached
+
     connection = get_mysql_connection()
     if not connection:
         return "Error: Could not connect to database"
-    
+
     try:
         cursor = connection.cursor()
-        cursor.execute(f"DESCRIBE {table_name}")
+        cursor.execute(
+            "SELECT COLUMN_NAME, COLUMN_TYPE FROM information_schema.columns "
+            "WHERE table_schema = %s AND table_name = %s ORDER BY ORDINAL_POSITION",
+            (MYSQL_DATABASE, table_name)
+        )
         schema = cursor.fetchall()
-        connection.close()
-        
-        schema_str = f"Table: {table_name}\n"
-        schema_str += "Columns:\n"
-        for col in schema:
-            schema_str += f"  - {col[0]} ({col[1]})\n"
-        
+
+        # information_schema returns no rows for an unknown table; surface
+        # that as an error (uncached) like DESCRIBE used to
+        if not schema:
+            return f"Error fetching schema: table '{table_name}' does not exist"
+
+        # One line instead of one line per column — fewer prompt tokens and
+        # a shorter stable prefix for the LLM cache
+        cols = ', '.join(f"{name} {col_type}" for name, col_type in schema)
+        schema_str = f"{table_name}({cols})"
+
+        _metadata_cache_set(('schema', table_name), schema_str)
         return schema_str
-    
+
     except Error as e:
-        connection.close()
         return f"Error fetching schema: {e}"
+    finally:
+        connection.close()
 
 def list_tables():
     """Get list of all tables in database"""
+    cached = _metadata_cache_get(('tables',))
+    if cached is not None:
+        return cached
+
     connection = get_mysql_connection()
     if not connection:
         return []
@@ -104,25 +233,26 @@ def list_tables():
         cursor = connection.cursor()
         cursor.execute("SHOW TABLES")
         tables = [table[0] for table in cursor.fetchall()]
-        connection.close()
+        _metadata_cache_set(('tables',), tables)
         return tables
-    
+
     except Error as e:
-        connection.close()
         print(f"Error listing tables: {e}")
         return []
+    finally:
+        connection.close()
 
 def init_database():
     """Initialize database if it doesn't exist"""
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv('MYSQL_HOST', 'localhost'),
-            port=int(os.getenv('MYSQL_PORT', 3306)),
-            user=os.getenv('MYSQL_USER', 'root'),
-            password=os.getenv('MYSQL_PASSWORD')
+        connection = MySQLdb.connect(
+            host=MYSQL_HOST,
+            port=MYSQL_PORT,
+            user=MYSQL_USER,
+            password=MYSQL_PASSWORD
         )
         cursor = connection.cursor()
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {os.getenv('MYSQL_DATABASE', 'chatdb')}")
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {MYSQL_DATABASE}")
         connection.close()
         return "Database initialized successfully"
     except Error as e:
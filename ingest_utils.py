@@ -1,12 +1,37 @@
 """
 Data ingestion utilities: CSV upload, table creation, data insertion
 """
+import asyncio
 import pandas as pd
-from db_utils import run_sql, get_table_schema
-from llm_utils import call_llm
+import sqlparse
+from MySQLdb import Error
+from sqlalchemy import types as sqltypes
+from db_utils import (
+    run_sql,
+    get_mysql_connection,
+    get_sqlalchemy_engine,
+    invalidate_metadata_cache,
+    is_valid_identifier,
+)
 
-def infer_sql_type(dtype, sample_values):
-    """Infer SQL data type from pandas dtype"""
+INSERT_BATCH_SIZE = 1000
+
+_SQLALCHEMY_TYPES = {
+    "INT": sqltypes.Integer,
+    "FLOAT": sqltypes.Float,
+    "BOOLEAN": sqltypes.Boolean,
+    "DATETIME": sqltypes.DateTime,
+}
+
+def _sqlalchemy_type(sql_type):
+    """Map an infer_sql_type string to the matching SQLAlchemy type"""
+    if sql_type.startswith("VARCHAR"):
+        return sqltypes.String(int(sql_type[8:-1]))
+    return _SQLALCHEMY_TYPES[sql_type]()
+
+def infer_sql_type(series):
+    """Infer SQL data type from a pandas column"""
+    dtype = series.dtype
     if pd.api.types.is_integer_dtype(dtype):
         return "INT"
     elif pd.api.types.is_float_dtype(dtype):
@@ -16,8 +41,9 @@ def infer_sql_type(dtype, sample_values):
     elif pd.api.types.is_datetime64_any_dtype(dtype):
         return "DATETIME"
     else:
-        # Check string length for VARCHAR
-        max_len = max([len(str(v)) for v in sample_values if pd.notna(v)], default=255)
+        # Check string length for VARCHAR over the whole column (vectorized)
+        lengths = series.dropna().astype(str).str.len()
+        max_len = int(lengths.max()) if len(lengths) else 255
         return f"VARCHAR({min(max_len * 2, 500)})"
 
 def csv_to_sql(file_path, table_name):
@@ -29,90 +55,110 @@ def csv_to_sql(file_path, table_name):
     Returns:
         Success/error message
     """
+    if not is_valid_identifier(table_name):
+        return f"Error: Invalid table name: {table_name}"
+
     try:
         # Read CSV
         df = pd.read_csv(file_path)
-        
+
         if df.empty:
             return "Error: CSV file is empty"
-        
-        # Generate CREATE TABLE statement
-        columns = []
+
+        # Infer column types, keeping the explicit typing from infer_sql_type
+        clean_cols = []
+        dtypes = {}
         for col in df.columns:
-            sql_type = infer_sql_type(df[col].dtype, df[col].head())
             clean_col = col.strip().replace(' ', '_').replace('-', '_')
-            columns.append(f"{clean_col} {sql_type}")
-        
-        create_stmt = f"CREATE TABLE {table_name} ({', '.join(columns)});"
-        
-        # Execute CREATE TABLE
-        result = run_sql(create_stmt, fetch=False)
-        if "Error" in result:
-            return f"Error creating table: {result}"
-        
-        # Generate and execute INSERT statements
-        insert_count = 0
-        for _, row in df.iterrows():
-            values = []
-            for val in row:
-                if pd.isna(val):
-                    values.append("NULL")
-                elif isinstance(val, str):
-                    # Escape single quotes
-                    escaped = val.replace("'", "''")
-                    values.append(f"'{escaped}'")
-                else:
-                    values.append(str(val))
-            
-            insert_stmt = f"INSERT INTO {table_name} VALUES ({', '.join(values)});"
-            result = run_sql(insert_stmt, fetch=False)
-            
-            if "Error" not in result:
-                insert_count += 1
-        
-        return f"Success! Created table '{table_name}' and inserted {insert_count} rows."
+            if not is_valid_identifier(clean_col):
+                return f"Error: Invalid column name: {col}"
+            clean_cols.append(clean_col)
+            dtypes[clean_col] = _sqlalchemy_type(infer_sql_type(df[col]))
+        df.columns = clean_cols
+
+        # Let pandas/SQLAlchemy create the table and bulk-load it in
+        # batches (NaN becomes NULL automatically). The default method
+        # goes through cursor.executemany, which mysqlclient rewrites
+        # into multi-row VALUES in C — faster than method='multi'
+        # assembling one giant statement in Python.
+        df.to_sql(
+            table_name,
+            get_sqlalchemy_engine(),
+            if_exists='fail',
+            index=False,
+            chunksize=INSERT_BATCH_SIZE,
+            dtype=dtypes
+        )
+        invalidate_metadata_cache(table_name)
+
+        return f"Success! Created table '{table_name}' and inserted {len(df)} rows."
     
     except Exception as e:
         return f"Error processing CSV: {e}"
 
-def create_table_from_text(description):
+async def create_table_from_text(description):
     """
     Create table from natural language description using LLM
     """
-    from llm_utils import prompt_create_table
-    
+    from llm_utils import prompt_create_table, strip_code_fence
+
     # Get CREATE TABLE SQL from LLM
-    sql = prompt_create_table(description)
-    
+    sql = await prompt_create_table(description)
+
     # Clean up response
-    sql = sql.strip()
-    if sql.startswith("```sql"):
-        sql = sql.replace("```sql", "").replace("```", "").strip()
+    sql = strip_code_fence(sql)
     
-    # Execute
-    result = run_sql(sql, fetch=False)
+    # Execute (in a worker thread so the event loop stays free)
+    result = await asyncio.to_thread(run_sql, sql, False)
+    if "Error" not in result:
+        invalidate_metadata_cache()
     return f"Generated SQL:\n{sql}\n\nResult: {result}"
 
-def insert_rows_from_text(table_name, rows_description):
+async def insert_rows_from_text(table_name, rows_description):
     """
     Insert rows from natural language description using LLM
     """
-    from llm_utils import prompt_insert_rows
-    
+    from llm_utils import prompt_insert_rows, strip_code_fence
+
     # Get INSERT SQL from LLM
-    sql = prompt_insert_rows(table_name, rows_description)
-    
+    sql = await prompt_insert_rows(table_name, rows_description)
+
     # Clean up response
-    sql = sql.strip()
-    if sql.startswith("```sql"):
-        sql = sql.replace("```sql", "").replace("```", "").strip()
-    
-    # Split multiple INSERT statements
-    statements = [s.strip() + ';' for s in sql.split(';') if s.strip()]
+    sql = strip_code_fence(sql)
     
+    # Split multiple INSERT statements (sqlparse keeps semicolons inside
+    # string literals intact, unlike a naive split on ';')
+    statements = [s for s in sqlparse.split(sql) if s.strip()]
+
+    # Run the batch in a worker thread so the event loop stays free
+    results = await asyncio.to_thread(_execute_statement_batch, statements)
+    if isinstance(results, str):
+        return results
+
+    return f"Generated SQL:\n{sql}\n\nResults:\n" + "\n".join(results)
+
+def _execute_statement_batch(statements):
+    """Run statements over one connection with a single commit"""
+    connection = get_mysql_connection()
+    if not connection:
+        return "Error: Could not connect to database"
+
     results = []
-    for stmt in statements:
-        result = run_sql(stmt, fetch=False)
-        results.append(result)
-    
-    return f"Generated SQL:\n{sql}\n\nResults:\n" + "\n".join(results)
\ No newline at end of file
+    try:
+        cursor = connection.cursor()
+        for stmt in statements:
+            cursor.execute(stmt)
+            results.append(f"Success: Query executed. Rows affected: {cursor.rowcount}")
+        connection.commit()
+    except Error as e:
+        connection.rollback()
+        # The rollback undid any statements that had already run, so don't
+        # report them as successes
+        results = [
+            f"Error executing query: {e}",
+            "Batch rolled back: no statements were applied."
+        ]
+    finally:
+        connection.close()
+
+    return results
\ No newline at end of file
@@ -1,126 +1,331 @@
-"""
-LLM utilities: OpenAI API calls and prompt templates
-"""
-from openai import OpenAI
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
-def call_llm(prompt, model="gpt-4o-mini", temperature=0):
-    """
-    Call OpenAI API with given prompt
-    Args:
-        prompt: The prompt string
-        model: Model name (default: gpt-4)
-        temperature: Creativity level (0 = deterministic)
-    Returns:
-        LLM response text
-    """
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=temperature
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"Error calling LLM: {e}"
-
-# =============================================================================
-# PROMPT TEMPLATES
-# =============================================================================
-
-def prompt_create_table(description):
-    """
-    Prompt: Convert natural language description to CREATE TABLE statement
-    """
-    prompt = f"""You are a SQL expert. Convert the following natural language description into a MySQL CREATE TABLE statement.
-
-User description: "{description}"
-
-Requirements:
-- Use appropriate data types (INT, VARCHAR, FLOAT, DATE, etc.)
-- Include PRIMARY KEY where appropriate
-- Use NOT NULL constraints when fields are essential
-- Return ONLY the SQL statement, no explanation
-
-Example:
-Input: "Create a table called students with id, name, and gpa"
-Output: CREATE TABLE students (id INT PRIMARY KEY AUTO_INCREMENT, name VARCHAR(100) NOT NULL, gpa FLOAT);
-
-Now generate the CREATE TABLE statement:"""
-    
-    return call_llm(prompt)
-
-def prompt_insert_rows(table_name, rows_description):
-    """
-    Prompt: Convert natural language row descriptions to INSERT statements
-    """
-    prompt = f"""You are a SQL expert. Convert the following natural language description into MySQL INSERT statements for the table '{table_name}'.
-
-User description: "{rows_description}"
-
-Requirements:
-- Generate INSERT INTO statements
-- Infer appropriate values and data types
-- Return ONLY the SQL statements, one per line, no explanation
-- Use single quotes for strings
-
-Example:
-Input for table 'students': "Add Alice with GPA 3.8 and Bob with GPA 3.5"
-Output:
-INSERT INTO students (name, gpa) VALUES ('Alice', 3.8);
-INSERT INTO students (name, gpa) VALUES ('Bob', 3.5);
-
-Now generate the INSERT statements:"""
-    
-    return call_llm(prompt)
-
-def prompt_text_to_sql(question, schema):
-    """
-    Prompt: Convert English question to SQL SELECT query
-    """
-    prompt = f"""You are a SQL expert. Convert the following question into a MySQL SELECT query.
-
-Table Schema:
-{schema}
-
-Question: "{question}"
-
-Requirements:
-- Write a valid MySQL SELECT query
-- Use appropriate WHERE, ORDER BY, GROUP BY, LIMIT clauses as needed
-- Return ONLY the SQL query, no explanation
-
-Example:
-Schema: Table students (id INT, name VARCHAR, gpa FLOAT)
-Question: "Which students have GPA above 3.5?"
-Output: SELECT name, gpa FROM students WHERE gpa > 3.5;
-
-Now generate the SQL query:"""
-    
-    return call_llm(prompt)
-
-def prompt_explain_results(question, sql_query, results):
-    """
-    Prompt: Explain query results in natural language
-    """
-    prompt = f"""You are a helpful assistant. Explain the following database query results in simple, natural language.
-
-Question: "{question}"
-SQL Query: {sql_query}
-Results: {results}
-
-Provide a brief, clear explanation (2-3 sentences maximum) of what the results show.
-
-Example:
-Question: "Which students have GPA above 3.5?"
-Results: [('Alice', 3.8), ('Bob', 3.9)]
-Explanation: "Two students have a GPA above 3.5: Alice with 3.8 and Bob with 3.9."
-
-Now provide your explanation:"""
-    
-    return call_llm(prompt, temperature=0.3)
\ No newline at end of file
+"""
+LLM utilities: OpenAI API calls and prompt templates
+"""
+from openai import AsyncOpenAI
+import atexit
+import hashlib
+import numpy as np
+import os
+import re
+from dotenv import load_dotenv
+
+load_dotenv()
+
+client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+# Optional local OpenAI-compatible backend (vLLM, llama.cpp, ...). Set
+# LLM_BACKEND=local to route the explanation step there; run the server
+# with prefix caching (e.g. vLLM --enable-prefix-caching) so the stable
+# system prompt gets KV-cache hits across requests. Text-to-SQL stays on
+# gpt-4o-mini for quality.
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'openai')
+LOCAL_LLM_BASE_URL = os.getenv('LOCAL_LLM_BASE_URL', 'http://localhost:8000/v1')
+LOCAL_LLM_MODEL = os.getenv('LOCAL_LLM_MODEL', 'local')
+
+_local_client = None
+if LLM_BACKEND == 'local':
+    _local_client = AsyncOpenAI(
+        base_url=LOCAL_LLM_BASE_URL,
+        api_key=os.getenv('LOCAL_LLM_API_KEY', 'not-needed')
+    )
+
+EXPLAIN_MODEL = LOCAL_LLM_MODEL if _local_client else "gpt-4o-mini"
+
+def _client_for(model):
+    """Pick the local client for the local model, OpenAI otherwise"""
+    if _local_client is not None and model == LOCAL_LLM_MODEL:
+        return _local_client
+    return client
+
+# Matches a ```sql / ```mysql / bare ``` fenced block around the whole response
+_FENCE_RE = re.compile(r"^\s*```(?:sql|mysql)?\s*\n?(.*?)\n?```\s*$", re.I | re.S)
+
+def strip_code_fence(text):
+    """Strip a Markdown code fence from an LLM response, if present"""
+    match = _FENCE_RE.match(text)
+    return (match.group(1) if match else text).strip()
+
+# Response cache for deterministic (temperature=0) calls, keyed by a hash
+# of (model, temperature, prompt) — repeat clicks skip the API round trip
+_llm_cache = {}
+LLM_CACHE_MAX_SIZE = 512
+
+def _cache_key(prompt, model, temperature, system):
+    """Hash (model, temperature, system, prompt) into a cache key"""
+    raw = f"{model}|{temperature}|{system}|{prompt}".encode()
+    return hashlib.blake2b(raw).hexdigest()
+
+async def call_llm(prompt, model="gpt-4o-mini", temperature=0, cache_bust=False, system=None):
+    """
+    Call OpenAI API with given prompt
+    Args:
+        prompt: The prompt string (dynamic part, sent as the user message)
+        model: Model name (default: gpt-4)
+        temperature: Creativity level (0 = deterministic)
+        cache_bust: If True, skip the cache and force a fresh API call
+        system: Optional static instructions, sent as a system message so
+                they form a stable prefix for OpenAI prompt caching
+    Returns:
+        LLM response text
+    """
+    cacheable = temperature == 0 and not cache_bust
+    key = _cache_key(prompt, model, temperature, system) if cacheable else None
+
+    if cacheable and key in _llm_cache:
+        return _llm_cache[key]
+
+    messages = []
+    if system:
+        messages.append({"role": "system", "content": system})
+    messages.append({"role": "user", "content": prompt})
+
+    try:
+        response = await _client_for(model).chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature
+        )
+        result = response.choices[0].message.content.strip()
+    except Exception as e:
+        return f"Error calling LLM: {e}"
+
+    if cacheable:
+        if len(_llm_cache) >= LLM_CACHE_MAX_SIZE:
+            _llm_cache.pop(next(iter(_llm_cache)))
+        _llm_cache[key] = result
+
+    return result
+
+# =============================================================================
+# SEMANTIC SQL CACHE
+#
+# Exact-match caching misses paraphrases ("GPA > 3.5" vs "high GPA"), so
+# when SEMANTIC_CACHE=1 we embed question+schema and reuse the stored SQL
+# of the nearest prior query when cosine similarity clears the threshold.
+# A plain NumPy dot product over normalized vectors is plenty at this
+# scale (a few thousand entries), so there's no FAISS dependency.
+# =============================================================================
+
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE', '0') == '1'
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_MAX_SIZE = 10000
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+_SEMANTIC_CACHE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'semantic_cache.npz')
+
+# Embeddings live in one stacked (n, dim) matrix kept up to date on
+# insert, so each lookup is a single dot product with no re-stacking;
+# each entry also records the schema it was generated against
+_semantic_matrix = None
+_semantic_sql = []
+_semantic_schemas = []
+
+def _load_semantic_cache():
+    """Load persisted question embeddings, SQL, and schemas from disk"""
+    try:
+        saved = np.load(_SEMANTIC_CACHE_PATH, allow_pickle=True)
+        return saved['vectors'], list(saved['sql']), list(saved['schemas'])
+    except Exception:
+        return None, [], []
+
+def _save_semantic_cache():
+    """Persist the semantic cache so it survives restarts"""
+    if _semantic_matrix is None:
+        return
+    try:
+        np.savez(
+            _SEMANTIC_CACHE_PATH,
+            vectors=_semantic_matrix,
+            sql=np.array(_semantic_sql, dtype=object),
+            schemas=np.array(_semantic_schemas, dtype=object)
+        )
+    except Exception as e:
+        print(f"Error saving semantic cache: {e}")
+
+if SEMANTIC_CACHE_ENABLED:
+    _semantic_matrix, _semantic_sql, _semantic_schemas = _load_semantic_cache()
+    atexit.register(_save_semantic_cache)
+
+async def _embed(content):
+    """Embed text and normalize so dot product equals cosine similarity"""
+    response = await client.embeddings.create(model=EMBEDDING_MODEL, input=content)
+    vector = np.asarray(response.data[0].embedding)
+    return vector / np.linalg.norm(vector)
+
+def _semantic_lookup(vector, schema):
+    """
+    Return the stored SQL nearest to vector, or None below threshold
+    Only entries generated against the exact same schema are considered:
+    similarity alone can't tell lookalike tables apart (students_2024 vs
+    students_2025 embed nearly identically).
+    """
+    if _semantic_matrix is None:
+        return None
+    similarities = _semantic_matrix @ vector
+    best = -1
+    for i, entry_schema in enumerate(_semantic_schemas):
+        if entry_schema == schema and (best < 0 or similarities[i] > similarities[best]):
+            best = i
+    if best >= 0 and similarities[best] >= SEMANTIC_CACHE_THRESHOLD:
+        return _semantic_sql[best]
+    return None
+
+def _semantic_store(vector, sql, schema):
+    global _semantic_matrix
+    if len(_semantic_sql) >= SEMANTIC_CACHE_MAX_SIZE:
+        return
+    if _semantic_matrix is None:
+        _semantic_matrix = vector[np.newaxis, :]
+    else:
+        _semantic_matrix = np.vstack((_semantic_matrix, vector))
+    _semantic_sql.append(sql)
+    _semantic_schemas.append(schema)
+
+# =============================================================================
+# PROMPT TEMPLATES
+#
+# Static instructions live in system-message constants so every call shares
+# a byte-identical prefix (required for OpenAI prompt caching to hit); the
+# dynamic user input always comes last.
+# =============================================================================
+
+SYSTEM_CREATE_TABLE = """You are a SQL expert. Convert the user's natural language description into a MySQL CREATE TABLE statement.
+
+Requirements:
+- Use appropriate data types (INT, VARCHAR, FLOAT, DATE, etc.)
+- Include PRIMARY KEY where appropriate
+- Use NOT NULL constraints when fields are essential
+- Return ONLY the SQL statement, no explanation
+
+Example:
+Input: "Create a table called students with id, name, and gpa"
+Output: CREATE TABLE students (id INT PRIMARY KEY AUTO_INCREMENT, name VARCHAR(100) NOT NULL, gpa FLOAT);"""
+
+SYSTEM_INSERT_ROWS = """You are a SQL expert. Convert the user's natural language description into MySQL INSERT statements for the named table.
+
+Requirements:
+- Generate INSERT INTO statements
+- Infer appropriate values and data types
+- Return ONLY the SQL statements, one per line, no explanation
+- Use single quotes for strings
+
+Example:
+Input for table 'students': "Add Alice with GPA 3.8 and Bob with GPA 3.5"
+Output:
+INSERT INTO students (name, gpa) VALUES ('Alice', 3.8);
+INSERT INTO students (name, gpa) VALUES ('Bob', 3.5);"""
+
+SYSTEM_TEXT_TO_SQL = """You are a SQL expert. Convert the user's question into a MySQL SELECT query.
+
+Requirements:
+- Write a valid MySQL SELECT query
+- Use appropriate WHERE, ORDER BY, GROUP BY, LIMIT clauses as needed
+- Return ONLY the SQL query, no explanation
+
+Example:
+Schema: students(id int, name varchar(100), gpa float)
+Question: "Which students have GPA above 3.5?"
+Output: SELECT name, gpa FROM students WHERE gpa > 3.5;"""
+
+SYSTEM_EXPLAIN_RESULTS = """You are a helpful assistant. Explain database query results in simple, natural language.
+
+Provide a brief, clear explanation (2-3 sentences maximum) of what the results show.
+
+Example:
+Question: "Which students have GPA above 3.5?"
+Results: [('Alice', 3.8), ('Bob', 3.9)]
+Explanation: "Two students have a GPA above 3.5: Alice with 3.8 and Bob with 3.9." """
+
+# Precomputed template pieces: the user messages are assembled by joining
+# these constants around the dynamic values, so the static bytes are reused
+# on every call instead of being re-rendered through an f-string
+_CREATE_TABLE_SUFFIX = '"\n\nNow generate the CREATE TABLE statement:'
+_INSERT_ROWS_MID = "'\nUser description: \""
+_INSERT_ROWS_SUFFIX = '"\n\nNow generate the INSERT statements:'
+_TEXT_TO_SQL_SYSTEM_PREFIX = SYSTEM_TEXT_TO_SQL + "\n\nSchema: "
+_TEXT_TO_SQL_SUFFIX = '"\n\nNow generate the SQL query:'
+_EXPLAIN_MID_SQL = '"\nSQL Query: '
+_EXPLAIN_MID_RESULTS = '\nResults: '
+_EXPLAIN_SUFFIX = '\n\nNow provide your explanation:'
+
+async def prompt_create_table(description):
+    """
+    Prompt: Convert natural language description to CREATE TABLE statement
+    """
+    prompt = ''.join(('User description: "', description, _CREATE_TABLE_SUFFIX))
+    return await call_llm(prompt, system=SYSTEM_CREATE_TABLE)
+
+async def prompt_insert_rows(table_name, rows_description):
+    """
+    Prompt: Convert natural language row descriptions to INSERT statements
+    """
+    prompt = ''.join(("Table: '", table_name, _INSERT_ROWS_MID, rows_description, _INSERT_ROWS_SUFFIX))
+    return await call_llm(prompt, system=SYSTEM_INSERT_ROWS)
+
+async def prompt_text_to_sql(question, schema):
+    """
+    Prompt: Convert English question to SQL SELECT query
+    """
+    # Check the semantic cache first: a near-duplicate question against
+    # the same schema reuses the stored SQL without an LLM round trip
+    vector = None
+    if SEMANTIC_CACHE_ENABLED:
+        try:
+            vector = await _embed(question + '\n' + schema)
+        except Exception as e:
+            print(f"Error embedding question: {e}")
+        if vector is not None:
+            cached = _semantic_lookup(vector, schema)
+            if cached is not None:
+                return cached
+
+    # The schema for a table is stable, so it goes into the system message
+    # too — the cacheable prefix then covers everything but the question
+    system = _TEXT_TO_SQL_SYSTEM_PREFIX + schema
+    prompt = ''.join(('Question: "', question, _TEXT_TO_SQL_SUFFIX))
+    sql = await call_llm(prompt, system=system)
+
+    if vector is not None and not sql.startswith("Error calling LLM"):
+        _semantic_store(vector, sql, schema)
+
+    return sql
+
+# Only a preview of the rows goes into the explanation prompt, so prompt
+# size stays bounded no matter how large the resultset is
+EXPLAIN_PREVIEW_ROWS = 20
+EXPLAIN_CACHE_MAX_SIZE = 256
+_explain_cache = {}
+
+async def prompt_explain_results(question, sql_query, results):
+    """
+    Prompt: Explain query results in natural language
+    Sends at most EXPLAIN_PREVIEW_ROWS rows (plus the total count) and
+    memoizes the explanation, since temperature 0.3 sits outside the
+    deterministic call_llm cache.
+    """
+    total = len(results)
+    preview = results[:EXPLAIN_PREVIEW_ROWS]
+
+    raw = f"{question}|{sql_query}|{total}|{preview}".encode()
+    key = hashlib.blake2b(raw).hexdigest()
+    if key in _explain_cache:
+        return _explain_cache[key]
+
+    results_text = str(preview)
+    if total > EXPLAIN_PREVIEW_ROWS:
+        results_text += f" (showing first {EXPLAIN_PREVIEW_ROWS} of {total} rows)"
+
+    prompt = ''.join((
+        'Question: "', question,
+        _EXPLAIN_MID_SQL, sql_query,
+        _EXPLAIN_MID_RESULTS, results_text,
+        _EXPLAIN_SUFFIX
+    ))
+    explanation = await call_llm(prompt, model=EXPLAIN_MODEL, temperature=0.3, system=SYSTEM_EXPLAIN_RESULTS)
+
+    if not explanation.startswith("Error calling LLM"):
+        if len(_explain_cache) >= EXPLAIN_CACHE_MAX_SIZE:
+            _explain_cache.pop(next(iter(_explain_cache)))
+        _explain_cache[key] = explanation
+
+    return explanation
\ No newline at end of file